@@ -4,23 +4,49 @@
 # dependencies = [
 #   "cbor2",
 #   "matplotlib",
+#   "numpy",
 # ]
 # ///
 #
 # To be run via: uv run docs/generate_charts.py
 
-import glob
+import functools
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+
+try:
+    # Use the C decoder directly where it is available.
+    from _cbor2 import loads as cbor_loads
+except ImportError:
+    from cbor2 import loads as cbor_loads
+
+# The charts are only ever written to disk, so skip interactive toolkit setup.
+matplotlib.use("Agg")
 
-import cbor2
 from matplotlib import pyplot as plt
+from matplotlib import ticker
+from matplotlib.collections import LineCollection
+
+MEASUREMENT_ROOT = "./target/criterion/data/main"
 
 def main():
-    draw_hash()
+    flags = {
+        "small": "--small" in sys.argv,
+        "medium": "--medium" in sys.argv,
+        "raw": "--raw" in sys.argv,
+        "portable": "--portable" in sys.argv,
+        "verbose": "--verbose" in sys.argv,
+    }
+    draw_hash(flags)
 #     draw_map()
 
 
-def draw_hash():
+def draw_hash(flags: dict):
     hash_settings = [
 #         ("rapidhash_raw", "b"),
 #         ("rapidhash_cc_rs", "orange"),
@@ -49,13 +75,13 @@ def draw_hash():
     ]
 
     # Filter out gxhash if --portable is specified
-    if "--portable" in sys.argv:
+    if flags["portable"]:
         hash_settings = [
             setting for setting in hash_settings
             if not setting[0].startswith("gxhash")
         ]
 
-    if "--raw" in sys.argv:
+    if flags["raw"]:
         hash_settings = [
             ("rapidhash_raw", "b"),
             ("rapidhash_cc_rs", "c"),
@@ -66,14 +92,14 @@ def draw_hash():
             ("rapidhash_cc_v1", "r"),
         ]
 
-    if "--small" in sys.argv or "--medium" in sys.argv:
+    if flags["small"] or flags["medium"]:
         hash_settings = [
             ("rapidhash-f", "b"),
             ("foldhash-f", "y"),
 #             ("fxhash", "r"),
         ]
 
-    if "--small" in sys.argv and "--raw" in sys.argv:
+    if flags["small"] and flags["raw"]:
         hash_settings = [
             ("rapidhash_cc_v3", "y"),
             ("rapidhash_cc_v3_1", "g"),
@@ -83,104 +109,113 @@ def draw_hash():
 
     # also available: 65536, 524288000
     sizes = [2, 8, 16, 25, 50, 64, 80, 160, 256, 350, 1024, 4096, ]
-    if "--small" in sys.argv:
+    if flags["small"]:
         sizes = list(range(0, 300))
-    if "--medium" in sys.argv:  # 50B increments up to 4kB
+    if flags["medium"]:  # 50B increments up to 4kB
         sizes = list(range(0, 40 * 100, 50))
 
-    latency_data = []
-    throughput_data = []
-    latency_data_u64 = []
-    throughput_data_u64 = []
-    latency_data_64k = []
-    throughput_data_64k = []
-    for (hash_function, _) in hash_settings:
-        latency_row = []
-        throughput_row = []
+    prefix = "str"
+    if flags["small"]:
+        prefix = "small"
+    if flags["medium"]:
+        prefix = "medium"
 
-        prefix = "str"
-        if "--small" in sys.argv:
-            prefix = "small"
-        if "--medium" in sys.argv:
-            prefix = "medium"
+    u64_measurement = "u64"
+    s64k_measurement = "str_65536"
+    if flags["raw"]:
+        u64_measurement = "str_8"
 
-        for size in sizes:
-            latency, throughput = load_latest_measurement_file("hash", hash_function, f"{prefix}_{size}")
-            latency_row.append(latency)
-            throughput_row.append(throughput)
+    if flags["small"]:
+        u64_measurement = "small_8"
+        s64k_measurement = "small_256"
 
-        latency_data.append(latency_row)
-        throughput_data.append(throughput_row)
+    if flags["medium"]:
+        u64_measurement = "medium_100"
+        s64k_measurement = "medium_19000"
 
-        u64_measurement = "u64"
-        s64k_measurement = "str_65536"
-        if "--raw" in sys.argv:
-            u64_measurement = "str_8"
+    sizes_arr = np.asarray(sizes, dtype=np.float64)
+    benches = [f"{prefix}_{size}" for size in sizes] + [u64_measurement, s64k_measurement]
+    jobs = [(hash_function, bench) for hash_function, _ in hash_settings for bench in benches]
 
-        if "--small" in sys.argv:
-            u64_measurement = "small_8"
-            s64k_measurement = "small_256"
+    # Warm the directory scan once so the worker threads don't all race to fill it.
+    _scan_group("hash")
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        results = list(executor.map(lambda job: load_latest_measurement_file("hash", *job), jobs))
 
-        if "--medium" in sys.argv:
-            u64_measurement = "medium_100"
-            s64k_measurement = "medium_19000"
+    # Shape (hash, bench, [latency, size, is_bytes]); the last two benches are the bar chart ones.
+    measurements = np.empty((len(hash_settings), len(benches), 3))
+    measurements.reshape(-1, 3)[:] = results
 
-        latency, throughput = load_latest_measurement_file("hash", hash_function, u64_measurement)
-        latency_data_u64.append(latency)
-        throughput_data_u64.append(throughput)
+    latency = measurements[..., 0]
+    throughput = to_throughput(latency, measurements[..., 1], measurements[..., 2].astype(bool))
 
-        latency, throughput = load_latest_measurement_file("hash", hash_function, s64k_measurement)
-        latency_data_64k.append(latency)
-        throughput_data_64k.append(throughput)
+    latency_data = latency[:, :len(sizes)]
+    throughput_data = throughput[:, :len(sizes)]
+    latency_data_u64, throughput_data_u64 = latency[:, -2], throughput[:, -2]
+    latency_data_64k, throughput_data_64k = latency[:, -1], throughput[:, -1]
 
     fig, axs = plt.subplots(2, 2, figsize=(12, 8), dpi=300)
+    # Both line charts are plotted against input size, so they share one x axis.
+    axs[0, 1].sharex(axs[0, 0])
+
+    # Styles are fixed per hash, so work them out once; "-f" variants are drawn dashed/hatched.
+    fast_variants = [hash_function.endswith("-f") for hash_function in hash_names]
+    linestyles = ["--" if fast else "-" for fast in fast_variants]
+    hatchstyles = ["//" if fast else None for fast in fast_variants]
+    edgecolors = ["white" if fast else None for fast in fast_variants]
+    linewidth = 1.0 if flags["small"] or flags["medium"] else 0.5
 
-    for i, (hash_function, color) in reversed(list(enumerate(hash_settings))):
-        linestyle = "--" if hash_function.endswith("-f") else "-"
-        linewidth = 1.0 if "--small" in sys.argv or "--medium" in sys.argv else 0.5
+    # Draw each chart's lines as a single collection, reversed so the first hash ends up on top.
+    ordered = list(reversed(range(len(hash_settings))))
+    colors = [hash_settings[i][1] for i in ordered]
 
-        axs[0, 0].plot(sizes, latency_data[i], label=hash_function, color=color, linestyle=linestyle, linewidth=linewidth)
-        axs[0, 1].plot(sizes, throughput_data[i], label=hash_function, color=color, linestyle=linestyle, linewidth=linewidth)
+    for ax, data in ((axs[0, 0], latency_data), (axs[0, 1], throughput_data)):
+        segments = np.stack(np.broadcast_arrays(sizes_arr, data[ordered]), axis=-1)
+        ax.add_collection(LineCollection(segments, colors=colors, linestyles=[linestyles[i] for i in ordered], linewidths=linewidth))
+        ax.autoscale_view()
 
         # Annotate the end of each line
-        axs[0, 0].annotate(hash_function, (sizes[-1], latency_data[i][-1]), color=color,
-                           xytext=(25, 0), textcoords='offset points', ha='left', va='center')
-        axs[0, 1].annotate(hash_function, (sizes[-1], throughput_data[i][-1]), color=color,
-                           xytext=(25, 0), textcoords='offset points', ha='left', va='center')
+        for i in ordered:
+            hash_function, color = hash_settings[i]
+            ax.annotate(hash_function, (sizes[-1], data[i][-1]), color=color,
+                        xytext=(25, 0), textcoords='offset points', ha='left', va='center')
 
     for i, (hash_function, color) in enumerate(hash_settings):
-        hatchstyle = "//" if hash_function.endswith("-f") else None
-        edgecolor = "white" if hash_function.endswith("-f") else None
-        print(hash_function, i, latency_data_u64[i], throughput_data_u64[i])
+        hatchstyle = hatchstyles[i]
+        edgecolor = edgecolors[i]
+        if flags["verbose"]:
+            print(hash_function, i, latency_data_u64[i], throughput_data_u64[i])
         # axs[1, 0].bar(hash_function, latency_data_u64[i], color=color, edgecolor=edgecolor, hatch=hatchstyle, zorder=3)
         axs[1, 0].bar(hash_function, throughput_data_u64[i], color=color, edgecolor=edgecolor, hatch=hatchstyle, zorder=3)
         axs[1, 1].bar(hash_function, throughput_data_64k[i], color=color, edgecolor=edgecolor, hatch=hatchstyle, zorder=3)
 
     labels = sizes
-    if "--small" in sys.argv or "--medium" in sys.argv:
+    if flags["small"] or flags["medium"]:
         labels = sizes[::20]
 
+    # Scale, locator and formatter on the shared x axis apply to both line charts.
+    if not (flags["small"] or flags["medium"]):
+        axs[0, 0].set_xscale("log", base=2)
+    axs[0, 0].xaxis.set_major_locator(ticker.FixedLocator(labels))
+    axs[0, 0].xaxis.set_major_formatter(ticker.FixedFormatter(labels))
+
     axs[0, 0].set_title("Latency (byte stream)")
     axs[0, 0].set_xlabel("Input size (bytes)")
     axs[0, 0].set_ylabel("Latency (ns)")
-    if not ("--small" in sys.argv or "--medium" in sys.argv):
-        axs[0, 0].set_xscale("log", base=2)
+    if not (flags["small"] or flags["medium"]):
         axs[0, 0].set_yscale("log", base=10)
-    axs[0, 0].set_xticks(labels)
-    axs[0, 0].set_xticklabels(labels, rotation=90, ha="right")
+    plt.setp(axs[0, 0].get_xticklabels(), rotation=90, ha="right")
 
     axs[0, 1].set_title("Throughput (byte stream)")
     axs[0, 1].set_xlabel("Input size (bytes)")
     axs[0, 1].set_ylabel("Throughput (GB/s)")
-    if not ("--small" in sys.argv or "--medium" in sys.argv):
-        axs[0, 1].set_xscale("log", base=2)
+    if not (flags["small"] or flags["medium"]):
         axs[0, 1].set_yscale("log", base=10)
-    axs[0, 1].set_xticks(labels)
-    axs[0, 1].set_xticklabels(labels, rotation=90, ha="right")
+    plt.setp(axs[0, 1].get_xticklabels(), rotation=90, ha="right")
 
-    if "--small" in sys.argv:
+    if flags["small"]:
         axs[1, 0].set_title("Throughput (bytes, 8B)")
-    elif "--medium" in sys.argv:
+    elif flags["medium"]:
         axs[1, 0].set_title("Throughput (bytes, 100B)")
     else:
         axs[1, 0].set_title("Throughput (u64)")
@@ -189,9 +224,9 @@ def draw_hash():
     axs[1, 0].set_xticklabels(hash_names, rotation=45, ha="right")
     axs[1, 0].grid(True, zorder=0, color="gainsboro")
 
-    if "--small" in sys.argv:
+    if flags["small"]:
         axs[1, 1].set_title("Throughput (bytes, 256B)")
-    if "--medium" in sys.argv:
+    if flags["medium"]:
         axs[1, 1].set_title("Throughput (bytes, 19kB)")
     else:
         axs[1, 1].set_title("Throughput (bytes, 64kB)")
@@ -226,8 +261,8 @@ def draw_map():
         throughput_row = []
 
         for (benchmark, _) in insert_benchmarks:
-            _, throughput = load_latest_measurement_file("map", hash_function, benchmark)
-            throughput_row.append(throughput)
+            latency, size, is_bytes = load_latest_measurement_file("map", hash_function, benchmark)
+            throughput_row.append(to_throughput(latency, size, is_bytes))
         throughput_data.append(throughput_row)
 
     fig, axs = plt.subplots(2, 2, figsize=(12, 8), dpi=300)
@@ -255,27 +290,47 @@ def draw_map():
     plt.savefig("bench_insert.svg")
 
 
-def load_latest_measurement_file(group: str, hash_function: str, bench: str) -> (float, float):
-    measurements = glob.glob(f"./target/criterion/data/main/{group}_{hash_function}/{bench}/measurement*")
-    measurements.sort()
-    assert len(measurements) > 0, f"No measurements found for {hash_function} {bench}"
-    measurement_file = measurements[-1]
+@functools.lru_cache(maxsize=None)
+def _scan_group(group: str) -> dict:
+    """Map each (hash_function, bench) in a group to its latest measurement file."""
+    prefix = f"{group}_"
+    latest = {}
+    with os.scandir(MEASUREMENT_ROOT) as functions:
+        for function_entry in functions:
+            if not function_entry.name.startswith(prefix) or not function_entry.is_dir():
+                continue
+            hash_function = function_entry.name[len(prefix):]
+            for root, _, files in os.walk(function_entry.path):
+                measurements = [f for f in files if f.startswith("measurement")]
+                if not measurements:
+                    continue
+                bench = os.path.relpath(root, function_entry.path)
+                latest[(hash_function, bench)] = os.path.join(root, max(measurements))
+    return latest
+
+
+def load_latest_measurement_file(group: str, hash_function: str, bench: str) -> (float, int, bool):
+    measurement_file = _scan_group(group).get((hash_function, bench))
+    assert measurement_file is not None, f"No measurements found for {hash_function} {bench}"
+
+    data = cbor_loads(Path(measurement_file).read_bytes())
+    # print(data)
+    latency = data["estimates"]["mean"]["point_estimate"]
+    throughput_var = data["throughput"]
+
+    is_bytes = "Bytes" in throughput_var
+    if is_bytes:
+        size = throughput_var["Bytes"]
+    else:
+        size = throughput_var["Elements"] or 450000
+    # print(hash_function, bench, size, latency)
 
-    with open(measurement_file, "rb") as f:
-        data = cbor2.load(f)
-        # print(data)
-        latency = data["estimates"]["mean"]["point_estimate"]
-        throughput_var = data["throughput"]
+    return latency, size, is_bytes
 
-        if "Bytes" in throughput_var:
-            size = throughput_var["Bytes"]
-            throughput = ((1_000_000_000 / latency) * size) / 1_000_000_000
-        else:
-            size = throughput_var["Elements"] or 450000
-            throughput = ((1_000_000_000 / latency) * size) / 1_000_000
-        # print(hash_function, bench, size, latency, throughput)
 
-    return latency, throughput
+def to_throughput(latency, size, is_bytes):
+    # Latency is in ns, so size / latency is bytes/ns == GB/s, or items/ns == 1000 M items/s.
+    return np.where(is_bytes, size / latency, size / latency * 1e3)
 
 
 if __name__ == "__main__":
@@ -11,12 +11,19 @@
 
 import csv
 import json
-import cbor2
+import os
 import sys
 import polars as pl
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    # Use the C decoder directly where it is available.
+    from _cbor2 import loads as cbor_loads
+except ImportError:
+    from cbor2 import loads as cbor_loads
+
 base_path = Path("./target/criterion/")
 csv_path = Path("./docs/bench.csv")
 
@@ -29,22 +36,34 @@ def extract():
         print(f"Path {base_path} does not exist. Run the benchmarks first.")
         sys.exit(1)
 
-    with csv_path.open("w") as csv_file:
-        csv_file.write("bench,distr,hash,ns\n")
+    benchmark_paths = [
+        (path, latest_measurement_file(path.parent))
+        for path in base_path.glob("data/main/realworld*/*/benchmark.cbor")
+    ]
+
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        rows = list(executor.map(load_benchmark_row, benchmark_paths))
+
+    with csv_path.open("w", buffering=1 << 20, newline="") as csv_file:
+        writer = csv.writer(csv_file, lineterminator="\n")
+        writer.writerow(["bench", "distr", "hash", "ns"])
+        writer.writerows(rows)
 
-        for path in base_path.glob("data/main/realworld*/*/benchmark.cbor"):
-            benchmark_path = path
-            sample_path = sorted(path.parent.glob("measurement*"))[-1]
+def latest_measurement_file(benchmark_dir: Path) -> Path:
+    measurement_file = max(benchmark_dir.glob("measurement*"), default=None)
+    assert measurement_file is not None, f"No measurements found in {benchmark_dir}"
+    return measurement_file
 
-            with benchmark_path.open("rb") as benchmark_file, sample_path.open("rb") as sample_file:
-                name = cbor2.load(benchmark_file)["id"]["function_id"]
-                samples = cbor2.load(sample_file)
+def load_benchmark_row(paths: (Path, Path)) -> list:
+    benchmark_path, sample_path = paths
+    name = cbor_loads(benchmark_path.read_bytes())["id"]["function_id"]
+    samples = cbor_loads(sample_path.read_bytes())
 
-#                 sample_times = sorted([t / n for t, n in zip(samples["times"], samples["iters"])])
-#                 robust = sample_times[len(sample_times) // 10]
+#     sample_times = sorted([t / n for t, n in zip(samples["times"], samples["iters"])])
+#     robust = sample_times[len(sample_times) // 10]
 
-                robust = samples["estimates"]["mean"]["point_estimate"]
-                csv_file.write(",".join(name.split("-", 2)) + "," + str(robust) + "\n")
+    robust = samples["estimates"]["mean"]["point_estimate"]
+    return [*name.split("-", 2), robust]
 
 def table():
     MAP_SIZE = 1000
@@ -92,34 +111,45 @@ def table():
     if "--portable" in sys.argv:
         hash_order = [h for h in hash_order if h != "gxhash"]
 
-    distr_order_df = pl.DataFrame({"distr": distr_order, "distr_order_idx": range(len(distr_order))})
-    bench_order_df = pl.DataFrame({"bench": bench_order, "bench_order_idx": range(len(bench_order))})
-    hash_order_df = pl.DataFrame({"hash": hash_order, "hash_order_idx": range(len(hash_order))})
+    distr_enum = pl.Enum(distr_order)
+    bench_enum = pl.Enum(bench_order)
+    hash_enum = pl.Enum(hash_order)
 
-    df = (
+    lf = (
         pl.scan_csv(csv_path)
             .with_columns(pl.col.hash.replace(name_repl))
+            .filter(
+                pl.col.distr.is_in(distr_order),
+                pl.col.bench.is_in(bench_order),
+                pl.col.hash.is_in(hash_order),
+            )
+            .with_columns(
+                pl.col.distr.cast(distr_enum),
+                pl.col.bench.cast(bench_enum),
+                pl.col.hash.cast(hash_enum),
+            )
             .with_columns(ns = pl.col.ns / pl.when(pl.col.bench == "setbuild").then(SET_BUILD_FACTOR).otherwise(1))
-            .join(distr_order_df.lazy(), on="distr")
-            .join(bench_order_df.lazy(), on="bench")
-            .join(hash_order_df.lazy(), on="hash")
-            .sort(["distr_order_idx", "distr", "bench_order_idx", "hash_order_idx"])
-            .select(pl.col.distr, pl.col.bench, pl.col.hash, pl.col.ns)
-            .collect()
+            # Enums sort by their declared order; cast back so the printed tables show plain strings.
+            .sort(["distr", "bench", "hash"])
+            .select(pl.col("distr", "bench", "hash").cast(pl.String), pl.col.ns)
     )
 
+    summary_lf = (
+        lf
+            .with_columns(rank = pl.col.ns.rank().over("distr", "bench"))
+            .group_by("hash", maintain_order=True)
+            .agg(
+                avg_rank = pl.col.rank.mean(),
+                geometric_mean = pl.col.ns.log().mean().exp()
+            )
+    )
+
+    # Collect both frames together so the shared scan and sort only run once.
+    df, summary = pl.collect_all([lf, summary_lf])
+
     with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=-1, float_precision=2, tbl_cell_alignment="RIGHT"):
         print(df.pivot("hash", values="ns"))
-        print(
-            df
-                .with_columns(rank = pl.col.ns.rank().over("distr", "bench"))
-                .group_by("hash", maintain_order=True)
-                .agg(
-                    avg_rank = pl.col.rank.mean(),
-                    geometric_mean = pl.col.ns.log().mean().exp()
-                )
-                .transpose(include_header=True, header_name="metric", column_names="hash")
-        )
+        print(summary.transpose(include_header=True, header_name="metric", column_names="hash"))
 
 def main():
     extract()